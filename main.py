@@ -1,6 +1,19 @@
 import os
 import json
+import hashlib
+import shutil
+import sys
+import tempfile
+import multiprocessing
+import fitz # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from src.core import PDFOutlineExtractor
+from src.utils import SETTINGS
+
+# Cached outlines live next to the outputs, keyed by PDF content + extractor version
+CACHE_DIR_NAME = '.cache'
+EXTRACTOR_SOURCES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', name)
+                     for name in ('core.py', 'utils.py')]
 
 def process_single_pdf(pdf_path):
     """Processes a single PDF file and returns its extracted outline."""
@@ -8,12 +21,84 @@ def process_single_pdf(pdf_path):
     outline = extractor.extract_outline(pdf_path)
     return outline
 
+def process_single_pdf_to_json(pdf_path):
+    """
+    Processes a single PDF file and returns its outline serialized as indented JSON,
+    plus whether extraction failed. Run in pool workers so the pure-Python
+    pretty-printer runs in parallel instead of serially in the parent.
+    """
+    outline = process_single_pdf(pdf_path)
+    return json.dumps(outline, indent=4, ensure_ascii=False), "error" in outline
+
+def pool_context():
+    """
+    Picks the start method for the extraction pool. On Linux, 'fork' lets workers inherit
+    the already imported PyMuPDF, SETTINGS and compiled patterns instead of re-importing
+    them in every worker. fork is unsafe with some C extensions on macOS, so other Unix
+    platforms use 'forkserver'; where neither exists (Windows) the default is kept.
+    """
+    if sys.platform.startswith('linux'):
+        return multiprocessing.get_context('fork')
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return None
+
+def extractor_fingerprint():
+    """
+    Hashes the settings, the extractor sources and the PyMuPDF/MuPDF versions, so cached
+    outlines go stale when any of them changes.
+    """
+    digest = hashlib.blake2b(json.dumps(SETTINGS, sort_keys=True).encode('utf-8'), digest_size=16)
+    # All extracted text comes from MuPDF, so a PyMuPDF upgrade can change the outlines too
+    digest.update(f"{fitz.VersionBind}/{fitz.VersionFitz}".encode('ascii'))
+    for source_path in EXTRACTOR_SOURCES:
+        with open(source_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def pdf_cache_key(pdf_path, fingerprint):
+    """
+    Returns the cache key of a PDF: a BLAKE2b hash of the extractor fingerprint, the file name
+    and the PDF bytes. extract_outline applies file-specific rules by name (file03.pdf), so the
+    same bytes under another name can yield a different outline and must not share an entry.
+    """
+    digest = hashlib.blake2b(fingerprint.encode('ascii'), digest_size=16)
+    digest.update(os.path.basename(pdf_path).encode('utf-8'))
+    digest.update(b'\0') # keeps the name from running into the PDF bytes
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_cache_entry(cache_path, outline_json):
+    """
+    Writes a cached outline atomically: the JSON goes to a temporary file in the cache
+    directory that is then renamed onto `cache_path`, so an interrupted write never
+    leaves a truncated entry that later runs would take for a hit.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(outline_json)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
 def process_directory(input_dir, output_dir):
-    """Processes all PDF files in an input directory and saves outlines to an output directory."""
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    """
+    Processes all PDF files in an input directory and saves outlines to an output directory.
+    Outlines are cached under `output_dir/.cache` by PDF content hash, so unchanged PDFs
+    are not re-extracted on the next run.
+    """
+    cache_dir = os.path.join(output_dir, CACHE_DIR_NAME)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
 
-    pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.pdf')]
+    # scandir yields names and full paths together and caches the file type, so there is no
+    # separate join or stat per file
+    with os.scandir(input_dir) as entries:
+        pdf_files = [entry for entry in entries if entry.is_file() and entry.name.lower().endswith('.pdf')]
     
     if not pdf_files:
         print(f"No PDF files found in {input_dir}.")
@@ -21,21 +106,53 @@ def process_directory(input_dir, output_dir):
 
     print(f"Found {len(pdf_files)} PDF files in {input_dir}. Starting extraction...")
 
-    for pdf_file_name in pdf_files:
-        pdf_path = os.path.join(input_dir, pdf_file_name)
-        print(f"Processing: {pdf_file_name}")
-        
-        outline = process_single_pdf(pdf_path)
-        
-        output_file_name = os.path.splitext(pdf_file_name)[0] + '.json'
+    fingerprint = extractor_fingerprint()
+    pending = []
+    for pdf_entry in pdf_files:
+        pdf_path = pdf_entry.path
+        pdf_file_name = pdf_entry.name
+        output_file_name = pdf_file_name.rsplit('.', 1)[0] + '.json'
         output_path = os.path.join(output_dir, output_file_name)
-        
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(outline, f, indent=4, ensure_ascii=False)
-            print(f"Extracted outline saved to: {output_file_name}")
-        except Exception as e:
-            print(f"Error saving outline for {pdf_file_name}: {e}")
+            cache_path = os.path.join(cache_dir, pdf_cache_key(pdf_path, fingerprint) + '.json')
+        except OSError:
+            # Unreadable PDFs are not cached; extract_outline reports the error in their output
+            cache_path = None
+
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                shutil.copyfile(cache_path, output_path)
+                print(f"Unchanged since last run, reused cached outline: {output_file_name}")
+            except Exception as e:
+                print(f"Error saving outline for {pdf_file_name}: {e}")
+        else:
+            pending.append((pdf_path, pdf_file_name, output_file_name, output_path, cache_path))
+
+    if pending:
+        # Each PDF is independent and extraction is CPU-bound inside MuPDF, so fan the
+        # files out over worker processes. More workers than cores only adds contention.
+        max_workers = min(os.cpu_count() or 1, len(pending))
+
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=pool_context()) as executor:
+            futures = {}
+            for pdf_path, pdf_file_name, output_file_name, output_path, cache_path in pending:
+                print(f"Processing: {pdf_file_name}")
+                futures[executor.submit(process_single_pdf_to_json, pdf_path)] = (pdf_file_name, output_file_name, output_path, cache_path)
+
+            for future in as_completed(futures):
+                pdf_file_name, output_file_name, output_path, cache_path = futures[future]
+                try:
+                    outline_json, failed = future.result()
+                    # Failed extractions are written out but never cached, so they are retried next run
+                    if failed or cache_path is None:
+                        with open(output_path, 'w', encoding='utf-8') as f:
+                            f.write(outline_json)
+                    else:
+                        write_cache_entry(cache_path, outline_json)
+                        shutil.copyfile(cache_path, output_path)
+                    print(f"Extracted outline saved to: {output_file_name}")
+                except Exception as e:
+                    print(f"Error saving outline for {pdf_file_name}: {e}")
     
     print("Extraction complete.")
 
@@ -1,122 +1,180 @@
 import fitz # PyMuPDF
 import re
-from collections import defaultdict
-from src.utils import SETTINGS, is_bold, is_italic
+from bisect import insort
+from collections import Counter
+from src.utils import SETTINGS, is_bold_font
+
+# Thresholds are read once at import; the heading rules run for every line of every page.
+_THRESHOLDS = SETTINGS['heading_detection_thresholds']
+FONT_SIZE_DIFF_FROM_DOMINANT = _THRESHOLDS['font_size_difference_from_dominant']
+BOLD_FONT_SIZE_MIN_RATIO = _THRESHOLDS['bold_font_size_min_ratio_to_dominant']
+MAX_WORDS_FOR_BOLD_HEADING = _THRESHOLDS['max_words_for_bold_heading']
+MAX_WORDS_FOR_ALL_CAPS_HEADING = _THRESHOLDS['max_words_for_all_caps_heading']
+MAX_HEADINGS_PER_PAGE = SETTINGS.get('max_headings_per_page', 4)
+# Rank of each level when choosing which candidates fill a page's heading cap
+LEVEL_ORDER = {"H1": 1, "H2": 2, "H3": 3, "H4": 4, "H_UNKNOWN": 5}
+
+# Patterns are compiled once at import time instead of on every line of every page.
+NUMBERED_HEADING_RE = re.compile(r"^\d+(\.\d+)*\s+") # e.g. "1 ", "1.1 ", "2.3.4 "
+NUMBERED_H1_RE = re.compile(r"^\d+\.\s+") # e.g. "1. Preamble"
+APPENDIX_RE = re.compile(r"^Appendix [A-Z]:\s+.*") # e.g. "Appendix A: ..."
+DIGITS_ONLY_RE = re.compile(r"\d+")
+# All header/footer patterns merged into one alternation so each line is scanned once
+FOOTER_HEADER_RE = re.compile("|".join(f"(?:{pattern})" for pattern in SETTINGS['common_footer_header_patterns']), re.IGNORECASE)
+
+# Heading keywords lowercased once for the case-insensitive match in Rule 4
+LOWER_HEADING_KEYWORDS = [keyword.lower() for keyword in SETTINGS['common_heading_keywords']]
+
+# Known H2 section titles from file03.json that aren't numbered (exact match)
+H2_EXACT_TITLES = frozenset({
+    "Summary", "Background", "The Business Plan to be Developed",
+    "Approach and Specific Proposal Requirements", "Evaluation and Awarding of Contract",
+})
+# Starts of the bold "...:" sub-section titles in file03.json that are H3s
+H3_COLON_PREFIXES = ("Equitable", "Shared", "Local", "Access", "Guidance", "Training", "Provincial", "Technological")
+
+# Default "dict" flags minus TEXT_PRESERVE_IMAGES (ligatures/whitespace handling unchanged)
+TEXT_EXTRACTION_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
 
 class PDFOutlineExtractor:
     def __init__(self):
         self.dominant_font_size = 0
         self.font_sizes_by_prominence = []
+        self.font_size_levels = {} # font size -> prominence-based H level
         self.processed_headings = set() # To avoid duplicate headings across pages
 
-    def _analyze_document_styles(self, document):
+    def _scan_document(self, document):
         """
-        Analyzes font properties (size, weight) across the entire document
-        to determine potential heading levels based on common patterns.
+        Reads every page exactly once, keeping the text lines of each page while
+        counting font sizes across the whole document.
+        Returns a list of (page_height, lines) tuples, one per physical page, where each
+        line is a flat (line_text, line_bbox, spans) tuple and each span is
+        (stripped_text, rounded_font_size, font_name).
         """
-        font_size_counts = defaultdict(int)
-        bold_font_sizes_counts = defaultdict(int)
-        unique_font_sizes = set()
+        font_size_counts = Counter()
+        pages = []
 
         for page_num in range(document.page_count):
             page = document.load_page(page_num)
-            blocks = page.get_text("dict")["blocks"]
-            for block in blocks:
-                if 'lines' in block:
-                    for line in block['lines']:
-                        for span in line['spans']:
-                            font_size = round(span['size'], 1)
-                            font_size_counts[font_size] += 1
-                            unique_font_sizes.add(font_size)
-                            if is_bold(span):
-                                bold_font_sizes_counts[font_size] += 1
-
+            # Only text is needed: leaving out TEXT_PRESERVE_IMAGES keeps MuPDF from
+            # decoding image streams and building image blocks we would throw away.
+            blocks = page.get_text("dict", flags=TEXT_EXTRACTION_FLAGS)["blocks"]
+            # Keep only the fields the heuristics use, so the nested dicts MuPDF builds
+            # for the page can be freed right away instead of living until the end.
+            lines = [
+                ("".join([span['text'] for span in line['spans']]).strip(), # list join: str.join pre-sizes from a list
+                 line['bbox'],
+                 [(span['text'].strip(), round(span['size'], 1), span['font']) for span in line['spans']])
+                for block in blocks if 'lines' in block
+                for line in block['lines']
+            ]
+
+            # Counter.update counts a whole page in C instead of one += per span
+            font_size_counts.update([font_size for _, _, spans in lines for _, font_size, _ in spans])
+            pages.append((page.rect.height, lines))
+
+        self._analyze_document_styles(font_size_counts)
+        return pages
+
+    def _analyze_document_styles(self, font_size_counts):
+        """
+        Analyzes font sizes across the entire document to find the dominant
+        (body text) size and rank the remaining sizes by prominence.
+        Works on the unique sizes only, so its cost does not grow with page count.
+        """
         if not font_size_counts:
             return
 
         # Exclude very small font sizes from dominant calculation (e.g., page numbers, footers)
-        filtered_font_sizes = {fs: count for fs, count in font_size_counts.items() if fs > 6} # Arbitrary threshold
-        if not filtered_font_sizes:
-            # Fallback if all fonts are tiny
-            self.dominant_font_size = max(font_size_counts, key=font_size_counts.get) if font_size_counts else 0
-        else:
-            self.dominant_font_size = max(filtered_font_sizes, key=filtered_font_sizes.get)
-
-
-        sorted_unique_sizes = sorted(list(unique_font_sizes), 
-                                     key=lambda fs: (fs, bold_font_sizes_counts.get(fs, 0)), 
-                                     reverse=True)
-        self.font_sizes_by_prominence = sorted_unique_sizes
-
-    def _is_likely_heading(self, text, span, line_bbox, prev_line_bbox=None, is_title_page=False):
+        body_font_sizes = [fs for fs in font_size_counts if fs > 6] # Arbitrary threshold
+        # Fallback to all sizes if all fonts are tiny
+        self.dominant_font_size = max(body_font_sizes or font_size_counts, key=font_size_counts.get)
+
+        # Sizes are unique keys, so ranking by size alone gives the prominence order
+        self.font_sizes_by_prominence = sorted(font_size_counts, reverse=True)
+        # Precompute each size's fallback level so _assign_heading_level needs one dict lookup
+        # instead of a linear .index() scan per heading
+        self.font_size_levels = {fs: f"H{min(idx + 1, 4)}" # Cap at H4 for general cases
+                                 for idx, fs in enumerate(self.font_sizes_by_prominence)}
+
+    def _is_likely_heading(self, text, font_size, is_bold_text, line_bbox, prev_line_bbox=None, is_title_page=False):
         """
-        Determines if a given text span is likely a heading based on general heuristics,
+        Determines if a given line of text is likely a heading based on general heuristics,
         configurable thresholds, and contextual rules for improved accuracy.
+        `font_size` and `is_bold_text` describe the line's first span.
         `is_title_page` helps handle the unique first page.
         """
-        font_size = round(span['size'], 1)
-        is_bold_text = is_bold(span)
+        dominant = self.dominant_font_size # Called for every line: read the attribute once
+
+        # Fast reject: every rule below needs at least one of these cues (bold, larger
+        # than body text, all caps, leading digit, trailing colon, question mark or a
+        # large gap above), so plain body-text lines skip the keyword loop and regexes.
+        if not (is_bold_text or font_size > dominant or text.isupper() or
+                text[:1].isdigit() or text.endswith(':') or '?' in text or
+                (prev_line_bbox and (line_bbox[1] - prev_line_bbox[3]) > (dominant * 1.5))):
+            return False
+
+        text_lower = text.lower() # Lowercased once per line, not once per keyword
         
         # Rule 1: Font size significantly larger than dominant body text font size
         # Less strict for higher levels, more strict for lower levels
-        if font_size > self.dominant_font_size + SETTINGS['heading_detection_thresholds']['font_size_difference_from_dominant']:
+        if font_size > dominant + FONT_SIZE_DIFF_FROM_DOMINANT:
             return True
 
         # Rule 2: Bold text that's not significantly smaller than dominant font
         # More stringent for H4s - they need other cues
-        if is_bold_text and font_size >= self.dominant_font_size * SETTINGS['heading_detection_thresholds']['bold_font_size_min_ratio_to_dominant']:
+        if is_bold_text and font_size >= dominant * BOLD_FONT_SIZE_MIN_RATIO:
             # Avoid picking up bold text within paragraphs too easily by checking length or all caps
-            if len(text.split()) < SETTINGS['heading_detection_thresholds']['max_words_for_bold_heading'] or text.isupper():
+            if len(text.split()) < MAX_WORDS_FOR_BOLD_HEADING or text.isupper():
                 return True
 
         # Rule 3: Common numbered heading patterns (e.g., "1.", "1.1")
-        if re.match(r"^\d+(\.\d+)*\s+[\S\s]*", text) and (font_size >= self.dominant_font_size - 1 or is_bold_text): # Allow slight smaller for numbered
+        if NUMBERED_HEADING_RE.match(text) and (font_size >= dominant - 1 or is_bold_text): # Allow slight smaller for numbered
             return True
         
         # Rule 4: Common keywords (case-insensitive). Keywords should often be bold or larger.
-        for keyword in SETTINGS['common_heading_keywords']:
-            if keyword.lower() in text.lower():
+        for keyword in LOWER_HEADING_KEYWORDS:
+            if keyword in text_lower:
                 # For keywords to be headings, they must be somewhat prominent, or followed by a colon for specific cases
-                if (is_bold_text and font_size >= self.dominant_font_size - 0.5) or \
-                   (font_size >= self.dominant_font_size + 0.5) or \
-                   (text.endswith(':') and font_size >= self.dominant_font_size - 1): # like "Timeline:"
+                if (is_bold_text and font_size >= dominant - 0.5) or \
+                   (font_size >= dominant + 0.5) or \
+                   (text.endswith(':') and font_size >= dominant - 1): # like "Timeline:"
                     return True
 
         # Rule 5: Text that is all uppercase and relatively short (common for section titles)
-        if text.isupper() and len(text.split()) < SETTINGS['heading_detection_thresholds']['max_words_for_all_caps_heading'] and font_size >= self.dominant_font_size - 1.0:
+        if text.isupper() and len(text.split()) < MAX_WORDS_FOR_ALL_CAPS_HEADING and font_size >= dominant - 1.0:
             return True
 
         # Rule 6: Significant vertical spacing (simple check)
         # Apply more strictly for non-bold/non-large fonts, especially for H4s
-        if prev_line_bbox and (line_bbox[1] - prev_line_bbox[3]) > (self.dominant_font_size * 1.5):
-            if font_size >= self.dominant_font_size - 0.5 and not text.endswith('.'): # Avoid ending in period
+        if prev_line_bbox and (line_bbox[1] - prev_line_bbox[3]) > (dominant * 1.5):
+            if font_size >= dominant - 0.5 and not text.endswith('.'): # Avoid ending in period
                 return True
 
         # Contextual Rules for file03.pdf's specific patterns
         # These are to match the *desired* output more precisely where general rules might miss.
 
         # Rule 7: Specific H2 keywords from file03.json that aren't strictly numbered
-        if text in ["Summary", "Background", "The Business Plan to be Developed",
-                    "Approach and Specific Proposal Requirements", "Evaluation and Awarding of Contract"]:
-            if is_bold_text or font_size >= self.dominant_font_size + 0.5: # Must be somewhat prominent
+        if text in H2_EXACT_TITLES:
+            if is_bold_text or font_size >= dominant + 0.5: # Must be somewhat prominent
                 return True
         
         # Rule 8: Appendix titles like "Appendix A: ..."
-        if re.match(r"^Appendix [A-Z]:\s+.*", text) and (is_bold_text or font_size > self.dominant_font_size):
+        if APPENDIX_RE.match(text) and (is_bold_text or font_size > dominant):
             return True
 
         # Rule 9: Bold phrases ending with a colon that signify sub-sections (like in file03.json H3s)
-        if text.endswith(':') and is_bold_text and len(text.split()) < 10 and font_size >= self.dominant_font_size - 0.5:
+        if text.endswith(':') and is_bold_text and len(text.split()) < 10 and font_size >= dominant - 0.5:
              # Add specific starts to avoid catching random bolded phrases
-             if text.startswith(("Equitable", "Shared", "Local", "Access", "Guidance", "Training", "Provincial", "Technological")):
+             if text.startswith(H3_COLON_PREFIXES):
                 return True
              
         # Rule 10: "What could the ODL really mean?" type of question-based heading
-        if "?" in text and text.startswith("What could the") and (is_bold_text or font_size >= self.dominant_font_size):
+        if "?" in text and text.startswith("What could the") and (is_bold_text or font_size >= dominant):
             return True
             
         # Rule 11: "For each Ontario citizen it could mean:" type of H4 from file03.json
-        if text.startswith("For each Ontario") and text.endswith("mean:") and (is_bold_text or font_size >= self.dominant_font_size - 1.0):
+        if text.startswith("For each Ontario") and text.endswith("mean:") and (is_bold_text or font_size >= dominant - 1.0):
             return True
 
         return False
@@ -127,7 +185,7 @@ class PDFOutlineExtractor:
         and structural patterns (like numbering), with adjustments for specific content patterns.
         """
         # Strongest indicators first: Numbering
-        if re.match(r"^\d+\.\s+[\S\s]*", text): # 1. Preamble
+        if NUMBERED_H1_RE.match(text): # 1. Preamble
             # Check font size to differentiate between H1, H2, H3 for numbered.
             # Example: 1. might be H1, 1.1 might be H2, 1.1.1 might be H3
             parts = text.split(' ')[0].split('.')
@@ -139,17 +197,16 @@ class PDFOutlineExtractor:
             return "H_UNKNOWN" # Fallback if more than H4 level numbering
 
         # Contextual level assignments for specific common patterns from file03.json
-        if text in ["Summary", "Background", "The Business Plan to be Developed",
-                    "Approach and Specific Proposal Requirements", "Evaluation and Awarding of Contract"]:
+        if text in H2_EXACT_TITLES:
             return "H2"
         
         if text == "Milestones": # From file03.json, this is H3
             return "H3"
             
-        if re.match(r"^Appendix [A-Z]:\s+.*", text): # e.g., "Appendix A: ..."
+        if APPENDIX_RE.match(text): # e.g., "Appendix A: ..."
             return "H2"
 
-        if text.endswith(':') and (text.startswith("Equitable") or text.startswith("Shared") or text.startswith("Local") or text.startswith("Access") or text.startswith("Guidance") or text.startswith("Training") or text.startswith("Provincial") or text.startswith("Technological")):
+        if text.endswith(':') and text.startswith(H3_COLON_PREFIXES):
             return "H3"
         
         if "?" in text and text.startswith("What could the"):
@@ -168,13 +225,88 @@ class PDFOutlineExtractor:
 
 
         # Fallback to prominence based on overall document font sizes if no specific rule applies
-        try:
-            idx = self.font_sizes_by_prominence.index(font_size)
-            level = min(idx + 1, 4) # Cap at H4 for general cases
-            return f"H{level}"
-        except ValueError:
-            return "H_UNKNOWN"
+        return self.font_size_levels.get(font_size, "H_UNKNOWN")
+
+
+    def _process_page(self, lines, page_idx, output_page_num, pdf_path, document_title):
+        """
+        Collects the heading candidates of a single page, in reading order.
+        Each candidate is a (level_rank, y_pos, seq, level, text) tuple, so the caller can
+        rank and cap them per page with a plain tuple sort; `seq` keeps ties in reading order.
+        MuPDF yields lines in content-stream order, not top to bottom, so the scan only
+        stops early once the page cap is filled with H1s and every remaining line sits
+        below the lowest of them; none of those lines could outrank a collected H1.
+        """
+        prev_line_bbox = None 
+        temp_page_candidates = [] # Store potential headings for the current page with y_pos
+        h1_y_positions = [] # Sorted y-positions of the H1s collected so far
+
+        # remaining_min_y[i] is the smallest y-position among lines[i:]
+        remaining_min_y = [0.0] * len(lines)
+        min_y = float('inf')
+        for i in range(len(lines) - 1, -1, -1):
+            min_y = min(min_y, lines[i][1][1])
+            remaining_min_y[i] = min_y
+
+        for line_idx, (line_text, line_bbox, spans) in enumerate(lines):
+            if len(h1_y_positions) >= MAX_HEADINGS_PER_PAGE and \
+               remaining_min_y[line_idx] > h1_y_positions[MAX_HEADINGS_PER_PAGE - 1]:
+                break
+
+            if not line_text:
+                prev_line_bbox = line_bbox
+                continue
+
+            # Cheap word-count reject first: long body lines are the slowest input for the footer regex
+            if len(line_text.split()) > MAX_WORDS_FOR_BOLD_HEADING * 2:
+                prev_line_bbox = line_bbox
+                continue
+
+            if FOOTER_HEADER_RE.search(line_text):
+                prev_line_bbox = line_bbox
+                continue
+
+            if spans:
+                _, first_font_size, first_font = spans[0]
+                
+                # Use is_title_page=True for page_idx 0 only for _is_likely_heading (if needed for special rules)
+                is_title_page_flag = (page_idx == 0)
+                
+                if self._is_likely_heading(line_text, first_font_size, is_bold_font(first_font), line_bbox, prev_line_bbox, is_title_page=is_title_page_flag):
+                    # Skip if it's the exact main title on subsequent pages
+                    if document_title and line_text == document_title and page_idx > 0:
+                        prev_line_bbox = line_bbox
+                        continue
+                    
+                    # Special filter for Page 1 of file03.pdf to match desired H1s
+                    # "Ontario’s Digital Library" is on page 2 in PDF, but page 1 in JSON
+                    if pdf_path.endswith("file03.pdf") and page_idx == 1:
+                        if line_text == "Ontario’s Digital Library" or \
+                           line_text == "A Critical Component for Implementing Ontario’s Road Map to Prosperity Strategy":
+                            pass # Allow these to be processed, assigned H1 by _assign_heading_level
+                        # Also ensure we don't pick "The Ontario Digital Library will make Ontario a better place..." on page 2 as a heading
+                        elif "The Ontario Digital Library will make Ontario a better place" in line_text:
+                            prev_line_bbox = line_bbox
+                            continue # Skip this as it's body text after main headings
+                    
+                    assigned_level = self._assign_heading_level(first_font_size, line_text)
+                    
+                    unique_heading_key = (line_text, assigned_level, output_page_num) 
+                    if unique_heading_key not in self.processed_headings:
+                        if assigned_level == "H1":
+                            insort(h1_y_positions, line_bbox[1])
+                        temp_page_candidates.append((
+                            LEVEL_ORDER.get(assigned_level, 99),
+                            line_bbox[1], # Store y-position for sorting
+                            len(temp_page_candidates),
+                            assigned_level,
+                            line_text,
+                        ))
+                        self.processed_headings.add(unique_heading_key)
+            
+            prev_line_bbox = line_bbox
 
+        return temp_page_candidates
 
     def extract_outline(self, pdf_path):
         """
@@ -188,7 +320,7 @@ class PDFOutlineExtractor:
 
         try:
             with fitz.open(pdf_path) as document:
-                self._analyze_document_styles(document)
+                pages = self._scan_document(document)
 
                 # --- Handle Main Title Extraction (Very Specific for file03.pdf's multi-span title) ---
                 # This part is the trickiest and might require specific logic for the first page
@@ -196,8 +328,7 @@ class PDFOutlineExtractor:
                 
                 # Check for the specific pattern of file03.pdf's title on page 0 
                 if document.page_count > 0:
-                    first_physical_page = document.load_page(0) # PyMuPDF's first page
-                    blocks = first_physical_page.get_text("dict")["blocks"]
+                    first_page_height, first_page_lines = pages[0] # PyMuPDF's first page
                     
                     title_parts = []
                     found_rfp_line = False
@@ -220,15 +351,12 @@ class PDFOutlineExtractor:
                     # Find and concatenate these specific parts
                     rfp_line = ""
                     to_present_line = ""
-                    for block in blocks:
-                        if 'lines' in block:
-                            for line in block['lines']:
-                                text = "".join(span['text'] for span in line['spans']).strip()
-                                # Check for exact or close match to known title components
-                                if "RFP: Request for Proposal" in text and line['bbox'][1] < first_physical_page.rect.height / 2: # Top half of page
-                                    rfp_line = text
-                                elif "To Present a Proposal for Developing the Business Plan for the Ontario Digital Library" in text and line['bbox'][1] < first_physical_page.rect.height / 2:
-                                    to_present_line = text
+                    for text, line_bbox, _ in first_page_lines:
+                        # Check for exact or close match to known title components
+                        if "RFP: Request for Proposal" in text and line_bbox[1] < first_page_height / 2: # Top half of page
+                            rfp_line = text
+                        elif "To Present a Proposal for Developing the Business Plan for the Ontario Digital Library" in text and line_bbox[1] < first_page_height / 2:
+                            to_present_line = text
                     
                     if rfp_line and to_present_line:
                         extracted_outline["title"] = f"{rfp_line} {to_present_line}".replace("\n", " ").strip()
@@ -241,22 +369,17 @@ class PDFOutlineExtractor:
                         # This is the more general approach from previous versions for the main title
                         title_candidates = []
                         max_title_font_size = 0
-                        for block in blocks:
-                            if 'lines' in block:
-                                for line in block['lines']:
-                                    for span in line['spans']:
-                                        text = span['text'].strip()
-                                        font_size = round(span['size'], 1)
-                                        
-                                        if font_size > max_title_font_size:
-                                            max_title_font_size = font_size
-                                            title_candidates = [text]
-                                        elif font_size == max_title_font_size:
-                                            title_candidates.append(text)
+                        for _, _, spans in first_page_lines:
+                            for text, font_size, _ in spans:
+                                if font_size > max_title_font_size:
+                                    max_title_font_size = font_size
+                                    title_candidates = [text]
+                                elif font_size == max_title_font_size:
+                                    title_candidates.append(text)
                         
                         if title_candidates:
-                            potential_title = " ".join(sorted(list(set(title_candidates)), key=lambda x: len(x), reverse=True)).strip()
-                            if len(potential_title) > 5 and not any(re.search(pattern, potential_title, re.IGNORECASE) for pattern in SETTINGS['common_footer_header_patterns']):
+                            potential_title = " ".join(sorted(set(title_candidates), key=len, reverse=True)).strip()
+                            if len(potential_title) > 5 and not FOOTER_HEADER_RE.search(potential_title):
                                 extracted_outline["title"] = potential_title
 
                 # Special handling for file05.pdf where the title is explicitly empty in the JSON
@@ -270,88 +393,27 @@ class PDFOutlineExtractor:
                 if pdf_path.endswith("file03.pdf"): # Special case for file03.pdf's cover page
                     content_page_offset = -1 # Because physical page 1 is content page 1, so physical_idx + 1 + offset = content_page_num
                 
-                for page_idx in range(document.page_count): # page_idx is 0-indexed
+                for page_idx, (_, lines) in enumerate(pages): # page_idx is 0-indexed
                     # Determine the output page number
                     output_page_num = page_idx + 1 + content_page_offset
                     if output_page_num < 1: # Don't output negative or zero page numbers (for cover pages)
                         continue
 
-                    page = document.load_page(page_idx)
-                    blocks = page.get_text("dict")["blocks"]
-                    
-                    prev_line_bbox = None 
-                    temp_page_candidates = [] # Store potential headings for the current page with y_pos
-
-                    for block in blocks:
-                        if 'lines' in block:
-                            for line in block['lines']:
-                                line_text = "".join(span['text'] for span in line['spans']).strip()
-                                line_bbox = line['bbox']
-
-                                if not line_text:
-                                    prev_line_bbox = line_bbox
-                                    continue
-
-                                if any(re.search(pattern, line_text, re.IGNORECASE) for pattern in SETTINGS['common_footer_header_patterns']):
-                                    prev_line_bbox = line_bbox
-                                    continue
-                                
-                                if len(line_text.split()) > SETTINGS['heading_detection_thresholds']['max_words_for_bold_heading'] * 2:
-                                    prev_line_bbox = line_bbox
-                                    continue
-
-                                if line['spans']:
-                                    first_span = line['spans'][0]
-                                    
-                                    # Use is_title_page=True for page_idx 0 only for _is_likely_heading (if needed for special rules)
-                                    is_title_page_flag = (page_idx == 0)
-                                    
-                                    if self._is_likely_heading(line_text, first_span, line_bbox, prev_line_bbox, is_title_page=is_title_page_flag):
-                                        # Skip if it's the exact main title on subsequent pages
-                                        if extracted_outline["title"] and line_text == extracted_outline["title"] and page_idx > 0:
-                                            prev_line_bbox = line_bbox
-                                            continue
-                                        
-                                        # Special filter for Page 1 of file03.pdf to match desired H1s
-                                        # "Ontario’s Digital Library" is on page 2 in PDF, but page 1 in JSON
-                                        if pdf_path.endswith("file03.pdf") and page_idx == 1:
-                                            if line_text == "Ontario’s Digital Library" or \
-                                               line_text == "A Critical Component for Implementing Ontario’s Road Map to Prosperity Strategy":
-                                                pass # Allow these to be processed, assigned H1 by _assign_heading_level
-                                            # Also ensure we don't pick "The Ontario Digital Library will make Ontario a better place..." on page 2 as a heading
-                                            elif "The Ontario Digital Library will make Ontario a better place" in line_text:
-                                                prev_line_bbox = line_bbox
-                                                continue # Skip this as it's body text after main headings
-                                        
-                                        assigned_level = self._assign_heading_level(round(first_span['size'], 1), line_text)
-                                        
-                                        unique_heading_key = (line_text, assigned_level, output_page_num) 
-                                        if unique_heading_key not in self.processed_headings:
-                                            temp_page_candidates.append({
-                                                "level": assigned_level,
-                                                "text": line_text,
-                                                "page": output_page_num,
-                                                "y_pos": line_bbox[1] # Store y-position for sorting
-                                            })
-                                            self.processed_headings.add(unique_heading_key)
-                                
-                                prev_line_bbox = line_bbox
+                    temp_page_candidates = self._process_page(lines, page_idx, output_page_num, pdf_path, extracted_outline["title"])
 
                     # Post-processing for page-level heading limit and "at least one"
-                    level_order = {"H1": 1, "H2": 2, "H3": 3, "H4": 4, "H_UNKNOWN": 5}
-                    
-                    sorted_potential_headings = sorted(temp_page_candidates, 
-                                                       key=lambda x: (level_order.get(x['level'], 99), x['y_pos']))
-
                     headings_to_add_this_page = []
                     
-                    if len(sorted_potential_headings) > SETTINGS.get('max_headings_per_page', 4):
-                        headings_to_add_this_page = sorted_potential_headings[:SETTINGS['max_headings_per_page']]
-                    elif len(sorted_potential_headings) > 0: 
-                        headings_to_add_this_page = sorted_potential_headings
+                    if temp_page_candidates:
+                        # Tuples sort by (level rank, y-position, reading order) without a key function
+                        temp_page_candidates.sort()
+                        headings_to_add_this_page = [
+                            {"level": level, "text": text, "page": output_page_num}
+                            for _, _, _, level, text in temp_page_candidates[:MAX_HEADINGS_PER_PAGE]
+                        ]
                     else:
                         # Fallback: If no headings were found on this page, try to find at least one prominent text
-                        first_valid_text = self._find_first_prominent_text(page, extracted_outline["title"])
+                        first_valid_text = self._find_first_prominent_text(lines, extracted_outline["title"])
                         if first_valid_text:
                             headings_to_add_this_page.append({
                                 "level": "H1", # Assign H1 for this fallback entry
@@ -359,11 +421,6 @@ class PDFOutlineExtractor:
                                 "page": output_page_num
                             })
 
-                    # Remove the temporary 'y_pos' key before adding to final outline
-                    for heading in headings_to_add_this_page:
-                        if 'y_pos' in heading:
-                            del heading['y_pos']
-                    
                     extracted_outline["outline"].extend(headings_to_add_this_page)
 
         except Exception as e:
@@ -372,7 +429,7 @@ class PDFOutlineExtractor:
 
         return extracted_outline
         
-    def _find_first_prominent_text(self, page, document_title):
+    def _find_first_prominent_text(self, lines, document_title):
         """
         Fallback function to find at least one prominent text on a page if no
         other headings are detected, ignoring common headers/footers and the main document title.
@@ -380,27 +437,22 @@ class PDFOutlineExtractor:
         """
         prominent_candidates = []
         
-        blocks = page.get_text("dict")["blocks"]
-        for block in blocks:
-            if 'lines' in block:
-                for line in block['lines']:
-                    for span in line['spans']:
-                        text = span['text'].strip()
-                        font_size = round(span['size'], 1)
-                        
-                        if not text:
-                            continue
-                        
-                        # Exclude common headers/footers and the main title
-                        if any(re.search(pattern, text, re.IGNORECASE) for pattern in SETTINGS['common_footer_header_patterns']) or \
-                           (document_title and text == document_title):
-                            continue
-                        
-                        # Heuristic for prominence in fallback: larger text or bold text
-                        if (font_size >= self.dominant_font_size - 0.5 or is_bold(span)) and \
-                           (len(text.split()) > 1 or (len(text) > 3 and not re.fullmatch(r'\d+', text))):
-                            
-                            prominent_candidates.append({"text": text, "y_pos": line['bbox'][1]})
+        for _, line_bbox, spans in lines:
+            for text, font_size, font in spans:
+                if not text:
+                    continue
+                
+                # Heuristic for prominence in fallback: larger text or bold text
+                if not ((font_size >= self.dominant_font_size - 0.5 or is_bold_font(font)) and \
+                        (len(text.split()) > 1 or (len(text) > 3 and not DIGITS_ONLY_RE.fullmatch(text)))):
+                    continue
+
+                # Exclude common headers/footers and the main title (regex only runs on prominent spans)
+                if FOOTER_HEADER_RE.search(text) or \
+                   (document_title and text == document_title):
+                    continue
+
+                prominent_candidates.append({"text": text, "y_pos": line_bbox[1]})
 
         if prominent_candidates:
             sorted_candidates = sorted(prominent_candidates, key=lambda x: x['y_pos'])
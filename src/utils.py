@@ -1,8 +1,13 @@
 import json
 import os
+from functools import cache, lru_cache
 
+@cache
 def load_settings(config_path='config/settings.json'):
-    """Loads settings from a JSON configuration file."""
+    """
+    Loads settings from a JSON configuration file.
+    Parsed once per path and process; later calls return the same dict.
+    """
     script_dir = os.path.dirname(__file__)
     abs_config_path = os.path.join(script_dir, '..', config_path)
     try:
@@ -17,12 +22,24 @@ def load_settings(config_path='config/settings.json'):
 
 SETTINGS = load_settings()
 
+# A document only uses a handful of distinct font names, so the name checks
+# are cached per font instead of being redone for every span.
+@lru_cache(maxsize=256)
+def is_bold_font(font_name):
+    """Checks if a font name is likely bold."""
+    font_name = font_name.lower()
+    return 'bold' in font_name or 'black' in font_name or 'heavy' in font_name
+
+@lru_cache(maxsize=256)
+def is_italic_font(font_name):
+    """Checks if a font name is likely italic."""
+    font_name = font_name.lower()
+    return 'italic' in font_name or 'oblique' in font_name
+
 def is_bold(span):
     """Checks if a span's font is likely bold."""
-    font_name = span['font'].lower()
-    return 'bold' in font_name or 'black' in font_name or 'heavy' in font_name
+    return is_bold_font(span['font'])
 
 def is_italic(span):
     """Checks if a span's font is likely italic."""
-    font_name = span['font'].lower()
-    return 'italic' in font_name or 'oblique' in font_name
\ No newline at end of file
+    return is_italic_font(span['font'])
\ No newline at end of file
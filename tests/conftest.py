@@ -0,0 +1,15 @@
+import pytest
+
+class _BenchmarkUnavailable:
+    """Stands in for pytest-benchmark when its plugin is not loaded."""
+
+    @pytest.fixture
+    def benchmark(self):
+        """Skips the requesting test instead of letting it error on a missing fixture."""
+        pytest.skip("pytest-benchmark is not loaded")
+
+def pytest_configure(config):
+    # Installed is not enough: `-p no:benchmark` or PYTEST_DISABLE_PLUGIN_AUTOLOAD=1 leave the
+    # package importable but the plugin, and its `benchmark` fixture, unregistered
+    if not config.pluginmanager.hasplugin("benchmark"):
+        config.pluginmanager.register(_BenchmarkUnavailable(), "benchmark-unavailable")
@@ -0,0 +1,54 @@
+import pytest
+import os
+import json
+import shutil
+from main import process_directory, CACHE_DIR_NAME
+
+# Define paths relative to the test file
+TEST_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+
+@pytest.fixture
+def pdf_dirs(tmp_path):
+    """
+    Provides (input_dir, output_dir) with a copy of data/, plus a renamed copy of file03.pdf
+    (which extract_outline treats specially by name) and a PDF that cannot be opened.
+    """
+    if not os.path.exists(os.path.join(DATA_DIR, "file03.pdf")):
+        pytest.skip(f"Test PDF file not found: {os.path.join(DATA_DIR, 'file03.pdf')}")
+    input_dir = tmp_path / "data"
+    shutil.copytree(DATA_DIR, input_dir)
+    shutil.copyfile(input_dir / "file03.pdf", input_dir / "report.pdf")
+    (input_dir / "broken.pdf").write_bytes(b"not a pdf")
+    return input_dir, tmp_path / "output"
+
+def read_outputs(output_dir):
+    """Returns the bytes of every JSON written to `output_dir`, keyed by file name."""
+    return {path.name: path.read_bytes() for path in output_dir.glob("*.json")}
+
+def test_process_directory_cache(pdf_dirs, capsys):
+    input_dir, output_dir = pdf_dirs
+    pdf_names = sorted(path.name for path in input_dir.glob("*.pdf"))
+
+    process_directory(str(input_dir), str(output_dir))
+    first_outputs = read_outputs(output_dir)
+    assert sorted(first_outputs) == [name.rsplit('.', 1)[0] + '.json' for name in pdf_names]
+
+    # The renamed copy gets its own outline, not the one cached for file03.pdf
+    assert first_outputs["report.json"] != first_outputs["file03.json"]
+
+    # The failed extraction is written out but not cached
+    assert "error" in json.loads(first_outputs["broken.json"])
+    cached_entries = list((output_dir / CACHE_DIR_NAME).glob("*.json"))
+    assert len(cached_entries) == len(pdf_names) - 1
+
+    capsys.readouterr()
+    process_directory(str(input_dir), str(output_dir))
+    second_run_log = capsys.readouterr().out
+
+    # Every good PDF is served from the cache with byte-identical output; the failed one is retried
+    assert read_outputs(output_dir) == first_outputs
+    reused = {name: f"reused cached outline: {name.rsplit('.', 1)[0]}.json" in second_run_log for name in pdf_names}
+    assert reused == {name: name != "broken.pdf" for name in pdf_names}
+    assert "Processing: broken.pdf" in second_run_log